@@ -1,11 +1,12 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.pool import NullPool
-from sqlalchemy import func, cast, Float
+from sqlalchemy import func, cast, Float, insert, select, delete, exists, text
 from dotenv import load_dotenv
+import click
 from datetime import timedelta, timezone, datetime
 from google import genai
 from google.genai import types
@@ -14,6 +15,13 @@ import os
 import base64
 import json
 import re
+import gzip
+import threading
+import queue
+import time
+import tracemalloc
+import resource
+from concurrent.futures import ThreadPoolExecutor
 
 load_dotenv()
 
@@ -25,12 +33,19 @@ app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config["JWT_SECRET_KEY"] = os.environ.get('JWT_SECRET_KEY')
 app.config["JWT_ACCESS_TOKEN_EXPIRES"] = timedelta(days=7)
+app.config['CHAT_ARCHIVE_AFTER_DAYS'] = int(os.environ.get('CHAT_ARCHIVE_AFTER_DAYS', 30))
+app.config['CHAT_COMPACTION_BATCH_SIZE'] = int(os.environ.get('CHAT_COMPACTION_BATCH_SIZE', 200))
+app.config['CHAT_COMPACTION_PAUSE_SECONDS'] = float(os.environ.get('CHAT_COMPACTION_PAUSE_SECONDS', 0))
+app.config['CHAT_COMPACTION_INTERVAL_HOURS'] = float(os.environ.get('CHAT_COMPACTION_INTERVAL_HOURS', 0))
 app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
     "poolclass": NullPool,
     "connect_args": {
         "prepare_threshold": None
     }
 }
+if (app.config['SQLALCHEMY_DATABASE_URI'] or '').startswith('sqlite'):
+    # tests and local runs on SQLite can't take the psycopg connect option
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {"poolclass": NullPool}
 
 db = SQLAlchemy(app)
 jwt = JWTManager(app)
@@ -82,6 +97,14 @@ class ChatMessage(db.Model):
     has_image = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
 
+    __table_args__ = (db.Index('ix_chat_message_session_created', 'session_id', 'created_at'),)
+
+class ChatArchive(db.Model):
+    session_id = db.Column(db.String(50), db.ForeignKey('chat_session.id'), primary_key=True)
+    data = db.Column(db.LargeBinary, nullable=False)
+    message_count = db.Column(db.Integer, nullable=False)
+    archived_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+
 
 class Score(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -268,6 +291,159 @@ def change_password():
 
 client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
 
+def chat_table_size():
+    size = {
+        "messages": db.session.query(func.count(ChatMessage.id)).scalar(),
+        "archives": db.session.query(func.count(ChatArchive.session_id)).scalar()
+    }
+    if db.engine.dialect.name == "postgresql":
+        size["message_bytes"] = db.session.query(func.pg_total_relation_size('chat_message')).scalar()
+        size["archive_bytes"] = db.session.query(func.pg_total_relation_size('chat_archive')).scalar()
+        # pg_stat counters are updated asynchronously, so this can lag the deletes slightly
+        size["message_dead_rows"] = db.session.execute(
+            text("SELECT n_dead_tup FROM pg_stat_user_tables WHERE relname = 'chat_message'")
+        ).scalar()
+    return size
+
+
+def restore_chat_session(session_id):
+    """Moves an archived session's messages back into chat_message. The caller commits."""
+    # same lock as compact_chat_sessions so the archive can't change underneath us
+    db.session.execute(select(ChatSession.id).where(ChatSession.id == session_id).with_for_update())
+    archive = db.session.get(ChatArchive, session_id)
+    if not archive:
+        return
+
+    rows = json.loads(gzip.decompress(archive.data))
+    for row in rows:
+        row["session_id"] = session_id
+        row["created_at"] = datetime.fromisoformat(row["created_at"]) if row["created_at"] else None
+
+    if rows:
+        db.session.execute(insert(ChatMessage), rows)
+    db.session.delete(archive)
+
+
+def read_chat_archive(archive):
+    return [
+        {"id": row["id"], "role": row["role"], "content": row["content"]}
+        for row in json.loads(gzip.decompress(archive.data))
+    ]
+
+
+def compact_chat_sessions(days=None, batch_size=None):
+    """Moves sessions with no messages in the last `days` days into ChatArchive, one gzip blob each."""
+    days = days if days is not None else app.config['CHAT_ARCHIVE_AFTER_DAYS']
+    batch_size = batch_size or app.config['CHAT_COMPACTION_BATCH_SIZE']
+    cutoff = datetime.now(timezone.utc) - timedelta(days=days)
+
+    before = chat_table_size()
+    sessions_archived = 0
+    messages_archived = 0
+
+    has_messages = exists().where(ChatMessage.session_id == ChatSession.id)
+    has_recent = exists().where(ChatMessage.session_id == ChatSession.id, ChatMessage.created_at >= cutoff)
+    last_id = ""
+
+    while True:
+        # Walk chat_session in id order; both EXISTS checks are index lookups on
+        # (session_id, created_at), so each batch costs the same however big chat_message is.
+        # The lock makes overlapping runs skip these sessions and restores/new messages wait for us.
+        locked_ids = db.session.execute(
+            select(ChatSession.id)
+            .where(ChatSession.id > last_id, has_messages, ~has_recent)
+            .order_by(ChatSession.id)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+        ).scalars().all()
+        if not locked_ids:
+            db.session.rollback()
+            break
+        last_id = locked_ids[-1]
+
+        messages = db.session.query(
+            ChatMessage.session_id, ChatMessage.id, ChatMessage.role,
+            ChatMessage.content, ChatMessage.has_image, ChatMessage.created_at
+        ).filter(
+            ChatMessage.session_id.in_(locked_ids),
+            ChatMessage.created_at < cutoff
+        ).order_by(
+            ChatMessage.session_id, ChatMessage.created_at, ChatMessage.id
+        ).all()
+
+        by_session = {}
+        for m in messages:
+            by_session.setdefault(m.session_id, []).append({
+                "id": m.id,
+                "role": m.role,
+                "content": m.content,
+                "has_image": m.has_image,
+                "created_at": m.created_at.isoformat() if m.created_at else None
+            })
+
+        for session_id, rows in by_session.items():
+            archive = db.session.get(ChatArchive, session_id)
+            if archive:
+                rows = json.loads(gzip.decompress(archive.data)) + rows
+            else:
+                archive = ChatArchive(session_id=session_id)
+                db.session.add(archive)
+            archive.data = gzip.compress(json.dumps(rows).encode("utf-8"))
+            archive.message_count = len(rows)
+
+        # only delete the rows that made it into an archive blob
+        db.session.execute(
+            delete(ChatMessage).where(ChatMessage.id.in_([m.id for m in messages]))
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+
+        sessions_archived += len(by_session)
+        messages_archived += len(messages)
+
+        if len(locked_ids) < batch_size:
+            break
+        time.sleep(app.config['CHAT_COMPACTION_PAUSE_SECONDS'])
+
+    report = {
+        "sessions_archived": sessions_archived,
+        "messages_archived": messages_archived,
+        "before": before,
+        "after": chat_table_size()
+    }
+    if db.engine.dialect.name == "postgresql":
+        report["note"] = (
+            "Deleted chat_message rows stay on disk as dead rows: message_bytes only drops after "
+            "VACUUM FULL or pg_repack, while a plain VACUUM lets new rows reuse the space."
+        )
+    return report
+
+
+@app.cli.command("compact-chats")
+@click.option("--days", type=int, default=None, help="Archive sessions inactive for this many days.")
+@click.option("--batch-size", type=int, default=None, help="Sessions archived per transaction.")
+@click.option("--every-hours", type=float, default=None,
+              help="Keep running and compact every N hours, e.g. as its own Procfile process.")
+def compact_chats_command(days, batch_size, every_hours):
+    if every_hours:
+        run_chat_compaction_loop(every_hours, days, batch_size)
+        return
+    report = compact_chat_sessions(days, batch_size)
+    print(json.dumps(report, indent=2))
+
+
+def run_chat_compaction_loop(interval_hours, days=None, batch_size=None):
+    while True:
+        with app.app_context():
+            try:
+                report = compact_chat_sessions(days, batch_size)
+                print(f"Chat compaction: {report}", flush=True)
+            except Exception as e:
+                print(f"Chat compaction failed: {e}", flush=True)
+                db.session.rollback()
+        time.sleep(interval_hours * 3600)
+
+
 @app.route('/chat/message', methods=['POST'])
 @jwt_required()
 def handle_chat():
@@ -286,6 +462,8 @@ def handle_chat():
         title_preview = user_text[:30] if user_text else "Image Shared"
         chat_session = ChatSession(id=session_id, user_id=user_id, title=title_preview)
         db.session.add(chat_session)
+    else:
+        restore_chat_session(session_id)
 
     user_db_msg = ChatMessage(session_id=session_id, role='user', content=user_text)
     db.session.add(user_db_msg)
@@ -354,9 +532,15 @@ def get_chat_history():
     user_id = get_jwt_identity()
     sessions = ChatSession.query.filter_by(user_id=user_id).order_by(ChatSession.created_at.desc()).all()
     
+    archives = {
+        a.session_id: a for a in ChatArchive.query.join(ChatSession).filter(ChatSession.user_id == user_id)
+    }
+
     result = []
     for s in sessions:
         msgs = [{"id": m.id, "role": m.role, "content": m.content} for m in s.messages]
+        if s.id in archives:
+            msgs = read_chat_archive(archives[s.id]) + msgs
         
         result.append({"id": s.id, "title": s.title, "date": s.created_at.strftime("%Y-%m-%d"), "messages": msgs})
     return jsonify(result)
@@ -425,19 +609,114 @@ def extract_events():
         db.session.rollback()
         return jsonify({"error": "Could not process image"}), 500
 
-@app.route('/chat/generate-test', methods=['POST'])
-@jwt_required()
-def generate_test():
-    user_id = get_jwt_identity()
-    data = request.json
-    subject = data.get('subject', 'General Topic')
-    context = data.get('context', '')
-    questionsCount = data.get('questionsCount', 5)
-    images = data.get('images', [])
+QUIZ_RESPONSE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "questions": {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {
+                    "question": {"type": "STRING"},
+                    "options": {"type": "ARRAY", "items": {"type": "STRING"}},
+                    "correct": {"type": "STRING"}
+                },
+                "required": ["question", "options", "correct"]
+            }
+        }
+    },
+    "required": ["questions"]
+}
 
-    if not context and not images:
-        return jsonify({"error": "No study material provided"}), 400
-    
+QUIZ_MAX_QUESTIONS = int(os.environ.get('QUIZ_MAX_QUESTIONS', 50))
+QUIZ_SHARD_MIN = int(os.environ.get('QUIZ_SHARD_MIN', 20))
+QUIZ_SHARD_SIZE = int(os.environ.get('QUIZ_SHARD_SIZE', 5))
+QUIZ_SHARD_CONCURRENCY = int(os.environ.get('QUIZ_SHARD_CONCURRENCY', 4))
+QUIZ_TOPUP_ROUNDS = 2
+QUIZ_DUPLICATE_THRESHOLD = 0.8
+
+
+class QuizStreamParser:
+    """Pulls finished question objects out of a partially received quiz JSON."""
+
+    def __init__(self):
+        self.buffer = ""
+        self.pos = 0
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.start = None
+
+    def feed(self, chunk):
+        self.buffer += chunk
+        completed = []
+
+        while self.pos < len(self.buffer):
+            ch = self.buffer[self.pos]
+
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif ch == "\\":
+                    self.escaped = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"':
+                self.in_string = True
+            elif ch in "{[":
+                self.depth += 1
+                # {"questions": [ { ... } ]} -> each question opens at depth 3
+                if ch == "{" and self.depth == 3:
+                    self.start = self.pos
+            elif ch in "}]":
+                self.depth -= 1
+                if ch == "}" and self.depth == 2 and self.start is not None:
+                    try:
+                        item = json.loads(self.buffer[self.start:self.pos + 1])
+                        if is_valid_question(item):
+                            completed.append(item)
+                    except ValueError:
+                        pass
+                    # drop what we already parsed so the buffer stays small
+                    self.buffer = self.buffer[self.pos + 1:]
+                    self.pos = -1
+                    self.start = None
+
+            self.pos += 1
+
+        return completed
+
+
+def is_valid_question(item):
+    return (
+        isinstance(item, dict)
+        and isinstance(item.get("question"), str)
+        and isinstance(item.get("options"), list)
+        and item.get("correct") in item["options"]
+    )
+
+
+def decode_image_parts(images):
+    parts = []
+    for img_base64 in images:
+        image_b64 = ''
+        if "," in img_base64:
+            image_b64 = img_base64.split(",")[1]
+        else:
+            image_b64 = img_base64
+            
+        image_data = base64.b64decode(image_b64.strip())
+            
+        parts.append(
+            types.Part.from_bytes(
+                data=image_data,
+                mime_type='image/jpeg'
+            )
+        )
+    return parts
+
+
+def build_quiz_contents(subject, context, questionsCount, image_parts, hint=""):
     prompt = f"""
     You are an expert teacher. Create a multiple-choice quiz based ONLY on the following study material.
 
@@ -448,56 +727,179 @@ def generate_test():
     Subject: {subject}
     Study Material: {context}
 
-    Return exactly {questionsCount} questions in valid JSON format. 
+    Return exactly {questionsCount} questions.
     Each question must have:
     - "question": the text of the question
     - "options": an array of 4 possible answers
     - "correct": the text of the correct answer (must match one of the options exactly)
+    {hint}
+    """
+
+    return [types.Part.from_text(text=prompt)] + image_parts
+
+
+def stream_quiz_questions(contents, ai_client=None):
+    ai_client = ai_client or client
+    stream = ai_client.models.generate_content_stream(
+        model="gemini-flash-latest",
+        contents=contents,
+        config=types.GenerateContentConfig(
+            response_mime_type="application/json",
+            response_schema=QUIZ_RESPONSE_SCHEMA
+        )
+    )
 
-    Response format:
-    {{
-        "questions": [
-            {{
-                "question": "example",
-                "options": ["a", "b", "c", "d"],
-                "correct": "a"
-            }}
-        ]
-    }}
+    parser = QuizStreamParser()
+    for chunk in stream:
+        if chunk.text:
+            yield from parser.feed(chunk.text)
+
+
+def question_key(question):
+    # Templated stems ("capital of france" / "capital of spain") are normal in quizzes,
+    # so the correct answer is part of the key and single-word changes still count.
+    text = f"{question['question']} {question['correct']}"
+    return frozenset(re.sub(r"[^\w\s]", " ", text.lower()).split())
+
+
+def is_duplicate_question(key, seen):
+    return any(
+        len(key & other) / len(key | other) >= QUIZ_DUPLICATE_THRESHOLD
+        for other in seen if key | other
+    )
+
+
+def shard_hint(index, shard_count, start, size, total, avoid):
+    hint = f"""
+    This quiz is generated in {shard_count} separate parts at the same time.
+    You are writing part {index + 1} of {shard_count} (questions {start + 1}-{start + size} of {total}).
+    Split the study material into {shard_count} roughly equal sections in order and
+    ask ONLY about section {index + 1}, so your questions do not overlap with the other parts.
     """
+    if avoid:
+        hint += "\n    Do NOT repeat or rephrase any of these existing questions:\n"
+        hint += "\n".join(f"    - {q}" for q in avoid)
+    return hint
+
+
+def generate_sharded_quiz(subject, context, questionsCount, image_parts, ai_client=None):
+    """Generates a large quiz as concurrent small shards and yields unique questions as soon as they are parsed."""
+    accepted = []
+    seen = []
+
+    for _ in range(QUIZ_TOPUP_ROUNDS + 1):
+        missing = questionsCount - len(accepted)
+        if missing <= 0:
+            return
+
+        # spread the questions evenly, e.g. 22 -> 5, 5, 4, 4, 4 rather than 5, 5, 5, 5, 2
+        shard_count = -(-missing // QUIZ_SHARD_SIZE)
+        shard_sizes = [missing // shard_count + (1 if i < missing % shard_count else 0) for i in range(shard_count)]
+        avoid = [q["question"] for q in accepted]
+        results = queue.Queue()
+        stop = threading.Event()
+
+        def run_shard(contents):
+            try:
+                for question in stream_quiz_questions(contents, ai_client):
+                    if stop.is_set():
+                        break
+                    results.put(("question", question))
+                results.put(("done", None))
+            except Exception as e:
+                results.put(("error", e))
+
+        pool = ThreadPoolExecutor(max_workers=QUIZ_SHARD_CONCURRENCY)
+        try:
+            start = len(accepted)
+            for index, size in enumerate(shard_sizes):
+                hint = shard_hint(index, len(shard_sizes), start, size, questionsCount, avoid)
+                pool.submit(run_shard, build_quiz_contents(subject, context, size, image_parts, hint))
+                start += size
+
+            pending = len(shard_sizes)
+            failures = 0
+            last_error = None
+            while pending and len(accepted) < questionsCount:
+                kind, value = results.get()
+                if kind == "question":
+                    key = question_key(value)
+                    if is_duplicate_question(key, seen):
+                        continue
+                    accepted.append(value)
+                    seen.append(key)
+                    yield value
+                else:
+                    pending -= 1
+                    if kind == "error":
+                        print(f"Quiz shard failed: {value}")
+                        failures += 1
+                        last_error = value
+        finally:
+            # don't block on shards that are still running if we are done or the client went away
+            stop.set()
+            pool.shutdown(wait=False, cancel_futures=True)
+
+        if failures == len(shard_sizes):
+            if not accepted:
+                raise last_error
+            return
 
-    contents = [
-        types.Part.from_text(text=prompt)
-    ]
 
-    for img_base64 in images:
-        image_b64 = ''
-        if "," in img_base64:
-            image_b64 = img_base64.split(",")[1]
-        else:
-            image_b64 = img_base64
-            
-        image_data = base64.b64decode(image_b64.strip())
-            
-        contents.append(
-            types.Part.from_bytes(
-                data=image_data,
-                mime_type='image/jpeg'
-            )
+@app.route('/chat/generate-test', methods=['POST'])
+@jwt_required()
+def generate_test():
+    user_id = get_jwt_identity()
+    data = request.json
+    subject = data.get('subject', 'General Topic')
+    context = data.get('context', '')
+    questionsCount = data.get('questionsCount', 5)
+    images = data.get('images', [])
+    stream = data.get('stream', False)
+
+    if not context and not images:
+        return jsonify({"error": "No study material provided"}), 400
+
+    if not isinstance(questionsCount, int) or not 1 <= questionsCount <= QUIZ_MAX_QUESTIONS:
+        return jsonify({"error": f"questionsCount must be between 1 and {QUIZ_MAX_QUESTIONS}"}), 400
+
+    sharded = data.get('sharded', questionsCount >= QUIZ_SHARD_MIN)
+
+    image_parts = decode_image_parts(images)
+
+    def questions():
+        if sharded:
+            return generate_sharded_quiz(subject, context, questionsCount, image_parts)
+        return stream_quiz_questions(build_quiz_contents(subject, context, questionsCount, image_parts))
+
+    if stream:
+        def generate():
+            count = 0
+            try:
+                for question in questions():
+                    count += 1
+                    yield json.dumps({"question": question}) + "\n"
+            except Exception as e:
+                print(f"Error streaming test: {e}")
+                yield json.dumps({"error": "Failed to connect to AI"}) + "\n"
+                return
+
+            if count == 0:
+                yield json.dumps({"error": "AI returned invalid format"}) + "\n"
+            else:
+                yield json.dumps({"done": True, "count": count, "missing": max(questionsCount - count, 0)}) + "\n"
+
+        return Response(
+            stream_with_context(generate()),
+            mimetype='application/x-ndjson',
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
         )
 
     try:
-        response = client.models.generate_content(
-            model="gemini-flash-latest",
-            contents=contents
-        )
-        
-        raw_text = response.text
-        json_match = re.search(r'\{.*\}', raw_text, re.DOTALL)
-        
-        if json_match:
-            quiz_data = json.loads(json_match.group())
-            return jsonify(quiz_data)
+        quiz = list(questions())
+
+        if quiz:
+            return jsonify({"questions": quiz, "missing": max(questionsCount - len(quiz), 0)})
         else:
             return jsonify({"error": "AI returned invalid format"}), 500
 
@@ -728,8 +1130,232 @@ def get_schoolwork_detail(id):
     })
 
 
+EXPORT_BATCH_SIZE = 1000
+
+
+def export_rows(kind, query):
+    # yield_per streams results through a server-side cursor instead of loading them all
+    result = db.session.execute(query.execution_options(yield_per=EXPORT_BATCH_SIZE))
+    for row in result.mappings():
+        yield json.dumps({"type": kind, "data": dict(row)}, default=lambda value: value.isoformat()) + "\n"
+
+
+def batch_lines(lines, size=EXPORT_BATCH_SIZE):
+    # one write per line costs far more in the WSGI server than building the JSON does
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) >= size:
+            yield "".join(batch)
+            batch = []
+    if batch:
+        yield "".join(batch)
+
+
+def export_user_data(user_id):
+    # Read everything from one snapshot so a compaction or restore running meanwhile
+    # can't move messages between chat_message and chat_archive mid-export.
+    if db.engine.dialect.name == "postgresql":
+        db.session.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+
+    try:
+        session_ids = select(ChatSession.id).where(ChatSession.user_id == user_id)
+
+        yield from export_rows("user", select(User.id, User.email).where(User.id == user_id))
+        yield from export_rows("event", select(
+            Event.id, Event.date, Event.type, Event.description, Event.created_at
+        ).where(Event.user_id == user_id).order_by(Event.id))
+        yield from export_rows("score", select(
+            Score.id, Score.subject, Score.score_value, Score.total, Score.timestamp
+        ).where(Score.user_id == user_id).order_by(Score.id))
+        yield from export_rows("schoolwork_analysis", select(
+            SchoolworkAnalysis.id, SchoolworkAnalysis.type, SchoolworkAnalysis.subject,
+            SchoolworkAnalysis.topic, SchoolworkAnalysis.content, SchoolworkAnalysis.created_at
+        ).where(SchoolworkAnalysis.user_id == user_id).order_by(SchoolworkAnalysis.id))
+        yield from export_rows("chat_session", select(
+            ChatSession.id, ChatSession.title, ChatSession.created_at
+        ).where(ChatSession.user_id == user_id).order_by(ChatSession.created_at))
+        yield from export_rows("chat_message", select(
+            ChatMessage.id, ChatMessage.session_id, ChatMessage.role,
+            ChatMessage.content, ChatMessage.has_image, ChatMessage.created_at
+        ).where(ChatMessage.session_id.in_(session_ids)).order_by(ChatMessage.id))
+
+        archives = db.session.execute(
+            select(ChatArchive.session_id, ChatArchive.data)
+            .where(ChatArchive.session_id.in_(session_ids))
+            .execution_options(yield_per=1)
+        )
+        for archive in archives:
+            for row in json.loads(gzip.decompress(archive.data)):
+                row["session_id"] = archive.session_id
+                yield json.dumps({"type": "chat_message", "data": row}) + "\n"
+
+    finally:
+        # end the read-only snapshot transaction so the next statement on this session starts fresh
+        db.session.rollback()
+
+def delete_user_data(user_id):
+    """Removes a user and every dependent row with set-based deletes in a single transaction."""
+    session_ids = select(ChatSession.id).where(ChatSession.user_id == user_id)
+
+    # synchronize_session=False keeps SQLAlchemy from fetching every deleted id back into Python
+    no_sync = {"synchronize_session": False}
+    db.session.execute(delete(ChatMessage).where(ChatMessage.session_id.in_(session_ids)).execution_options(**no_sync))
+    db.session.execute(delete(ChatArchive).where(ChatArchive.session_id.in_(session_ids)).execution_options(**no_sync))
+    db.session.execute(delete(ChatSession).where(ChatSession.user_id == user_id).execution_options(**no_sync))
+    db.session.execute(delete(Event).where(Event.user_id == user_id).execution_options(**no_sync))
+    db.session.execute(delete(Score).where(Score.user_id == user_id).execution_options(**no_sync))
+    db.session.execute(delete(SchoolworkAnalysis).where(SchoolworkAnalysis.user_id == user_id).execution_options(**no_sync))
+    db.session.execute(delete(User).where(User.id == user_id).execution_options(**no_sync))
+    db.session.commit()
+
+
+@app.get("/auth/export")
+@jwt_required()
+def export_account():
+    user_id = int(get_jwt_identity())
+
+    return Response(
+        stream_with_context(batch_lines(export_user_data(user_id))),
+        mimetype='application/x-ndjson',
+        headers={"Content-Disposition": "attachment; filename=student-helper-export.ndjson"}
+    )
+
+
+@app.post("/auth/delete_account")
+@jwt_required()
+def delete_account():
+    data = request.get_json()
+    password = data.get("password")
+
+    if not isinstance(password, str):
+        return {"message": "Invalid password"}, 400
+
+    user_id = int(get_jwt_identity())
+    user = db.session.get(User, user_id)
+
+    if not user:
+        return {"message": "User not found"}, 404
+
+    if not user.check_password(password):
+        return {"message": "Invalid credentials"}, 401
+
+    try:
+        delete_user_data(user_id)
+        return {"message": "Account deleted"}
+    except Exception as e:
+        print(f"Delete account error: {e}")
+        db.session.rollback()
+        return {"message": "Failed to delete account"}, 500
+
+
+# small seed chunks keep seeding from setting the process's peak RSS above the export's
+BENCHMARK_CHUNK_SIZE = 1000
+
+
+@app.cli.command("benchmark-account-data")
+@click.option("--rows", type=int, default=100000, help="Rows to create per table for the synthetic user.")
+@click.option("--yes", is_flag=True, help="Confirm that DATABASE_URL points at a database this may write to.")
+def benchmark_account_data_command(rows, yes):
+    """Seeds a user with a large history, then times the streaming export and the account delete."""
+    if not yes:
+        raise click.ClickException(
+            f"This writes {4 * rows} rows to {db.engine.url.render_as_string(hide_password=True)}. "
+            "Point DATABASE_URL at a scratch database and pass --yes."
+        )
+
+    now = datetime.now(timezone.utc)
+    user = User(email=f"benchmark-{int(time.time())}@example.com")
+    user.set_password("benchmark")
+    db.session.add(user)
+    db.session.commit()
+    user_id = user.id
+
+    try:
+        session_count = max(rows // 100, 1)
+        for start in range(0, rows, BENCHMARK_CHUNK_SIZE):
+            chunk = range(start, min(start + BENCHMARK_CHUNK_SIZE, rows))
+            db.session.execute(insert(Event), [
+                {"user_id": user_id, "date": "2025-01-01", "type": "homework", "description": f"Event {i}", "created_at": now}
+                for i in chunk
+            ])
+            db.session.execute(insert(Score), [
+                {"user_id": user_id, "subject": "Math", "score_value": i % 10, "total": 10, "timestamp": now}
+                for i in chunk
+            ])
+            db.session.execute(insert(SchoolworkAnalysis), [
+                {"user_id": user_id, "type": "homework", "subject": "Math", "topic": "", "content": f"Analysis {i}", "created_at": now}
+                for i in chunk
+            ])
+        db.session.execute(insert(ChatSession), [
+            {"id": f"benchmark-{user_id}-{i}", "user_id": user_id, "title": "Benchmark", "created_at": now}
+            for i in range(session_count)
+        ])
+        for start in range(0, rows, BENCHMARK_CHUNK_SIZE):
+            db.session.execute(insert(ChatMessage), [
+                {"session_id": f"benchmark-{user_id}-{i % session_count}", "role": "user", "content": f"Message {i}", "has_image": False, "created_at": now}
+                for i in range(start, min(start + BENCHMARK_CHUNK_SIZE, rows))
+            ])
+        db.session.commit()
+
+        token = create_access_token(identity=str(user_id))
+
+        def run_export():
+            lines = 0
+            with app.test_client() as test_client:
+                response = test_client.get("/auth/export", headers={"Authorization": f"Bearer {token}"}, buffered=False)
+                if response.status_code != 200:
+                    raise click.ClickException(f"Export failed with status {response.status_code}")
+                for chunk in response.response:
+                    lines += chunk.count(b"\n")
+                response.close()
+            return lines
+
+        # ru_maxrss is the process peak (KiB on Linux) and also covers memory held inside
+        # the database driver, which tracemalloc can't see.
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        started = time.perf_counter()
+        lines = run_export()
+        export_seconds = time.perf_counter() - started
+        rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+        # tracemalloc slows Python down several times, so the heap peak gets its own pass
+        tracemalloc.start()
+        run_export()
+        _, export_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    finally:
+        # always remove the synthetic user, even if seeding or the export failed
+        db.session.rollback()
+        started = time.perf_counter()
+        delete_user_data(user_id)
+        delete_seconds = time.perf_counter() - started
+
+    print(json.dumps({
+        "database": f"{db.engine.dialect.name}+{db.engine.dialect.driver}",
+        "rows_per_table": rows,
+        "export_lines": lines,
+        "export_seconds": round(export_seconds, 2),
+        "export_peak_mb": round(export_peak / 1024 / 1024, 2),
+        "max_rss_before_export_mb": round(rss_before / 1024, 1),
+        "max_rss_after_export_mb": round(rss_after / 1024, 1),
+        "delete_seconds": round(delete_seconds, 2)
+    }, indent=2))
+
+
 with app.app_context():
     db.create_all() 
+    # create_all skips indexes on tables that already exist
+    for index in ChatMessage.__table__.indexes:
+        index.create(db.engine, checkfirst=True)
 
 if __name__ == "__main__":
+    # Only the dev server starts the compaction thread, and only in the reloader's child.
+    # Under gunicorn run `flask --app app compact-chats --every-hours N` as its own process.
+    if app.config['CHAT_COMPACTION_INTERVAL_HOURS'] > 0 and os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        threading.Thread(
+            target=run_chat_compaction_loop,
+            args=(app.config['CHAT_COMPACTION_INTERVAL_HOURS'],),
+            daemon=True
+        ).start()
     app.run(host="0.0.0.0", port=5000, debug=True)
\ No newline at end of file
@@ -0,0 +1,119 @@
+import itertools
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import unittest
+from types import SimpleNamespace
+
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'test.db')}")
+os.environ.setdefault("JWT_SECRET_KEY", "test-secret-key-that-is-long-enough")
+os.environ.setdefault("GEMINI_API_KEY", "test")
+
+import app as student_app
+
+
+class FakeClient:
+    """Stands in for genai.Client: streams each shard's quiz JSON in small pieces."""
+
+    def __init__(self, make_question, fail_calls=()):
+        self.models = self
+        self.make_question = make_question
+        self.fail_calls = fail_calls
+        self.calls = 0
+        self.shard_sizes = []
+        self.running = 0
+        self.max_running = 0
+        self.lock = threading.Lock()
+        self.counter = itertools.count()
+
+    def generate_content_stream(self, model, contents, config):
+        with self.lock:
+            self.calls += 1
+            call = self.calls
+        size = int(re.search(r"Return exactly (\d+)", contents[0].text).group(1))
+        self.shard_sizes.append(size)
+        if call in self.fail_calls or "all" in self.fail_calls:
+            raise RuntimeError("shard failed")
+
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        try:
+            text = json.dumps({"questions": [self.make_question(next(self.counter)) for _ in range(size)]})
+            for i in range(0, len(text), 16):
+                time.sleep(0.001)
+                yield SimpleNamespace(text=text[i:i + 16])
+        finally:
+            with self.lock:
+                self.running -= 1
+
+
+def distinct_question(n):
+    return {"question": f"What happened in year {1900 + n}?", "options": [f"a{n}", "b"], "correct": f"a{n}"}
+
+
+def question(text, correct):
+    return {"question": text, "options": [correct, "other"], "correct": correct}
+
+
+def generate(count, client):
+    return list(student_app.generate_sharded_quiz("History", "notes", count, [], client))
+
+
+class QuestionKeyTest(unittest.TestCase):
+    def test_templated_questions_are_not_duplicates(self):
+        pairs = [
+            (question("What is the capital of France?", "Paris"), question("What is the capital of Spain?", "Madrid")),
+            (question("What does the mitochondria do?", "Energy"), question("What does the ribosome do?", "Proteins")),
+            (question("When did World War I end?", "1918"), question("When did World War II end?", "1945")),
+            (question("What is the derivative of x^2?", "2x"), question("What is the derivative of x^3?", "3x^2")),
+        ]
+        for first, second in pairs:
+            seen = [student_app.question_key(first)]
+            self.assertFalse(student_app.is_duplicate_question(student_app.question_key(second), seen))
+
+    def test_repeated_question_is_duplicate(self):
+        seen = [student_app.question_key(question("What is the capital of France?", "Paris"))]
+        key = student_app.question_key(question("what is the capital of France", "Paris"))
+        self.assertTrue(student_app.is_duplicate_question(key, seen))
+
+
+class ShardedQuizTest(unittest.TestCase):
+    def test_shards_are_balanced_and_bounded(self):
+        client = FakeClient(distinct_question)
+        quiz = generate(22, client)
+
+        self.assertEqual(len(quiz), 22)
+        self.assertEqual(sorted(client.shard_sizes, reverse=True), [5, 5, 4, 4, 4])
+        self.assertLessEqual(client.max_running, student_app.QUIZ_SHARD_CONCURRENCY)
+
+    def test_duplicates_are_dropped_and_topped_up(self):
+        # every seventh question repeats the same one
+        def make(n):
+            return question("What is the capital of France?", "Paris") if n % 7 == 0 else distinct_question(n)
+
+        quiz = generate(20, FakeClient(make))
+
+        self.assertEqual(len(quiz), 20)
+        self.assertEqual(sum(q["correct"] == "Paris" for q in quiz), 1)
+
+    def test_failed_topup_round_returns_partial_quiz(self):
+        def make(n):
+            return question("What is the capital of France?", "Paris") if n < 2 else distinct_question(n)
+
+        # the first round's 4 shards succeed, every top-up shard fails
+        client = FakeClient(make, fail_calls=range(5, 100))
+        quiz = generate(20, client)
+
+        self.assertEqual(len(quiz), 19)
+
+    def test_all_shards_failing_raises(self):
+        with self.assertRaises(RuntimeError):
+            generate(20, FakeClient(distinct_question, fail_calls=("all",)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,4 +1,4 @@
-import React, { useState, useCallback } from 'react';
+import React, { useState, useCallback, useRef, useEffect } from 'react';
 import * as ImagePicker from 'expo-image-picker'
 import {
   View, Text, StyleSheet, ScrollView, TouchableOpacity, Image,
@@ -11,6 +11,7 @@ import { Ionicons } from '@expo/vector-icons';
 import Animated, { FadeInDown, SlideInRight, ZoomIn, Layout, FadeIn } from 'react-native-reanimated';
 
 const TOP_PADDING = Platform.OS === 'ios' ? 50 : (StatusBar.currentHeight || 0) + 10;
+const QUIZ_TIMEOUT_MS = 180000;
 
 export default function TestGeneratorScreen() {
   const { session } = useSession();
@@ -29,6 +30,15 @@ export default function TestGeneratorScreen() {
   const [quiz, setQuiz] = useState<any[] | null>(null);
   const [userAnswers, setUserAnswers] = useState<Record<number, string>>({});
   const [score, setScore] = useState<number | null>(null);
+  const quizRequest = useRef<XMLHttpRequest | null>(null);
+
+  const abortQuizRequest = () => {
+    const xhr = quizRequest.current;
+    quizRequest.current = null;
+    xhr?.abort();
+  };
+
+  useEffect(() => abortQuizRequest, []);
 
   useFocusEffect(
     useCallback(() => {
@@ -86,27 +96,88 @@ export default function TestGeneratorScreen() {
     if (!context.trim() && images.length === 0) return Alert.alert("Context Required", "Please paste your study notes first.");
 
     setIsGenerating(true);
-    try {
-      const response = await fetch(`${API_URL}/chat/generate-test`, {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-          'Authorization': `Bearer ${session}`
-        },
-        body: JSON.stringify({
-          subject: selectedTest.description,
-          context: context,
-          questionsCount: numQuestions,
-          images: images
-        }),
-      });
-      const data = await response.json();
-      setQuiz(data.questions);
-    } catch (e) {
+    setUserAnswers({});
+
+    // The backend streams one NDJSON line per finished question,
+    // so the quiz can be shown as soon as the first one arrives.
+    abortQuizRequest();
+    const xhr = new XMLHttpRequest();
+    quizRequest.current = xhr;
+    // Callbacks from a cancelled or replaced request must not touch the screen.
+    const isCurrent = () => quizRequest.current === xhr;
+    let received = 0;
+    let questions: any[] = [];
+    let finished = false;
+    let failed = false;
+
+    const readLines = (final = false) => {
+      const lines = xhr.responseText.split('\n');
+      // Without `final` the last piece may still be a half-received line.
+      const complete = final ? lines.length : lines.length - 1;
+      while (received < complete) {
+        const line = lines[received++].trim();
+        if (!line) continue;
+        let msg: any;
+        try {
+          msg = JSON.parse(line);
+        } catch (e) {
+          failed = true;
+          continue;
+        }
+        if (msg.question) {
+          questions = [...questions, msg.question];
+          setQuiz(questions);
+        } else if (msg.error) {
+          failed = true;
+        } else if (msg.done) {
+          finished = true;
+          if (msg.missing) failed = true;
+        }
+      }
+    };
+
+    xhr.open('POST', `${API_URL}/chat/generate-test`);
+    xhr.setRequestHeader('Content-Type', 'application/json');
+    xhr.setRequestHeader('Authorization', `Bearer ${session}`);
+    xhr.timeout = QUIZ_TIMEOUT_MS;
+    xhr.onprogress = () => {
+      if (isCurrent() && xhr.status === 200) readLines();
+    };
+    xhr.onload = () => {
+      if (!isCurrent()) return;
+      quizRequest.current = null;
+      setIsGenerating(false);
+
+      if (xhr.status !== 200) {
+        return Alert.alert("AI Error", "Couldn't generate the test. Check your backend connection.");
+      }
+
+      readLines(true);
+      if (questions.length === 0) {
+        Alert.alert("AI Error", "Couldn't generate the test. Check your backend connection.");
+      } else if (failed || !finished) {
+        Alert.alert("Incomplete Test", `Only ${questions.length} of ${numQuestions} questions could be generated.`);
+      }
+    };
+    xhr.onerror = () => {
+      if (!isCurrent()) return;
+      quizRequest.current = null;
       Alert.alert("AI Error", "Couldn't generate the test. Check your backend connection.");
-    } finally {
       setIsGenerating(false);
-    }
+    };
+    xhr.ontimeout = () => {
+      if (!isCurrent()) return;
+      quizRequest.current = null;
+      Alert.alert("AI Error", "Generating the test took too long. Please try again.");
+      setIsGenerating(false);
+    };
+    xhr.send(JSON.stringify({
+      subject: selectedTest.description,
+      context: context,
+      questionsCount: numQuestions,
+      images: images,
+      stream: true
+    }));
   };
 
   const calculateScore = async () => {
@@ -138,6 +209,8 @@ export default function TestGeneratorScreen() {
   };
 
   const resetQuiz = () => {
+    abortQuizRequest();
+    setIsGenerating(false);
     setQuiz(null);
     setScore(null);
     setSelectedTest(null);
@@ -197,7 +270,9 @@ export default function TestGeneratorScreen() {
           </Animated.View>
         ))}
 
-        {score === null ? (
+        {isGenerating ? (
+          <ActivityIndicator size="large" color="#2563eb" style={{ marginVertical: 20 }} />
+        ) : score === null ? (
           <TouchableOpacity style={styles.submitBtn} onPress={calculateScore}>
             <Text style={styles.btnText}>Finish and Calculate Score</Text>
           </TouchableOpacity>